@@ -0,0 +1,254 @@
+import hashlib
+import json
+import pathlib
+import sqlite3
+import time
+from typing import Any, Iterable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+# Semantic lookup backends, imported on first use by _load_semantic_backend()
+# since sentence-transformers pulls in torch. Without them only exact-match
+# lookups are available.
+faiss: Any = None
+np: Any = None
+SentenceTransformer: Any = None
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def _load_semantic_backend() -> bool:
+    global faiss, np, SentenceTransformer
+    if SentenceTransformer is None:
+        try:
+            import faiss as faiss_module  # type: ignore
+            import numpy as numpy_module  # type: ignore
+            from sentence_transformers import SentenceTransformer as encoder_class  # type: ignore
+        except ImportError:
+            return False
+        faiss, np, SentenceTransformer = faiss_module, numpy_module, encoder_class
+    return True
+
+
+class LLMCache:
+    """SQLite-backed cache of model responses keyed by prompt.
+
+    Lookups first try an exact hash of ``(model, scope, prompt)``. On a miss,
+    and when sentence-transformers and FAISS are installed, the prompt is
+    embedded and compared against every cached prompt with the same model and
+    ``scope``; the closest entry is returned if its cosine similarity reaches
+    ``threshold``. Prompts should hold only the finding-specific text: the
+    embedding model truncates long inputs, so a shared preamble would make
+    every prompt look alike. Callers fold whatever else shapes the response
+    (instructions, response format) into ``scope``, so changing it
+    invalidates older entries.
+
+    Entries older than ``ttl`` seconds are ignored and purged. Once the cache
+    holds more than ``max_entries`` rows the least recently used are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        threshold: float = 0.92,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 10_000,
+        embedding_model: str = EMBEDDING_MODEL,
+    ):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(self.path)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding BLOB,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                scope TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        if "scope" not in columns:
+            # Databases written before scoped lookups; their rows never match a scope.
+            self._db.execute("ALTER TABLE entries ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+        self._db.commit()
+        self._encoder: Any = SentenceTransformer(embedding_model) if _load_semantic_backend() else None
+        # Per-(model, scope) FAISS index over cached embeddings, rebuilt lazily after writes.
+        self._indexes: dict[tuple[str, str], tuple[Any, list[str]]] = {}
+
+    @property
+    def semantic(self) -> bool:
+        return self._encoder is not None
+
+    def get(self, model: str, prompt: str, scope: str = "") -> Optional[str]:
+        self._purge_expired()
+        key = _prompt_key(model, prompt, scope)
+        row = self._db.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None and self.semantic:
+            nearest = self._nearest(model, scope, self._embed(prompt))
+            if nearest is not None:
+                key = nearest
+                row = self._db.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return row[0]
+
+    def put(self, model: str, prompt: str, response: str, scope: str = "") -> None:
+        now = time.time()
+        embedding = self._embed(prompt).tobytes() if self.semantic else None
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (_prompt_key(model, prompt, scope), model, prompt, response, embedding, now, now, scope),
+        )
+        self._db.execute(
+            """
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+        self._db.commit()
+        self._indexes.clear()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _purge_expired(self) -> None:
+        cursor = self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        if cursor.rowcount:
+            self._db.commit()
+            self._indexes.clear()
+
+    def _embed(self, text: str):
+        vector = self._encoder.encode([text], normalize_embeddings=True)
+        return np.asarray(vector, dtype="float32")
+
+    def _nearest(self, model: str, scope: str, query) -> Optional[str]:
+        if (model, scope) not in self._indexes:
+            rows = self._db.execute(
+                "SELECT key, embedding FROM entries WHERE model = ? AND scope = ? AND embedding IS NOT NULL",
+                (model, scope),
+            ).fetchall()
+            if not rows:
+                return None
+            vectors = np.vstack([np.frombuffer(blob, dtype="float32") for _, blob in rows])
+            index = faiss.IndexFlatIP(vectors.shape[1])
+            index.add(vectors)
+            self._indexes[model, scope] = (index, [key for key, _ in rows])
+        index, keys = self._indexes[model, scope]
+        scores, ids = index.search(query, 1)
+        if ids[0][0] < 0 or scores[0][0] < self.threshold:
+            return None
+        return keys[ids[0][0]]
+
+
+def _prompt_key(model: str, prompt: str, scope: str = "") -> str:
+    return hashlib.sha256(f"{model}\0{scope}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class RecordCache:
+    """SQLite-backed store of extracted triage records.
+
+    Records are keyed by a fingerprint of the SARIF file, the source archive,
+    the context size and ``format_version``, plus the result index. Opening
+    the cache for a fingerprint drops the records left behind for the same
+    SARIF file and context size by older inputs or record formats; records
+    for other context sizes are kept.
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        sarif_path: str | pathlib.Path,
+        src_zip: str | pathlib.Path,
+        context: int,
+        format_version: int = 0,
+    ):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._source = str(pathlib.Path(sarif_path).resolve())
+        self._context = context
+        self._fingerprint = _file_fingerprint(sarif_path, src_zip, context, format_version)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                fingerprint TEXT NOT NULL,
+                result_index INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                record TEXT NOT NULL,
+                context INTEGER,
+                PRIMARY KEY (fingerprint, result_index)
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(records)")}
+        if "context" not in columns:
+            self._db.execute("ALTER TABLE records ADD COLUMN context INTEGER")
+        # Rows without a context predate format versioning and are always stale.
+        self._db.execute(
+            "DELETE FROM records WHERE source = ? AND (context = ? OR context IS NULL) AND fingerprint != ?",
+            (self._source, self._context, self._fingerprint),
+        )
+        self._db.commit()
+
+    def get_many(self, indexes: Iterable[int]) -> dict[int, dict]:
+        indexes = list(indexes)
+        if not indexes:
+            return {}
+        placeholders = ", ".join("?" * len(indexes))
+        rows = self._db.execute(
+            f"SELECT result_index, record FROM records WHERE fingerprint = ? AND result_index IN ({placeholders})",
+            (self._fingerprint, *indexes),
+        )
+        loads = orjson.loads if orjson is not None else json.loads
+        return {index: loads(record) for index, record in rows}
+
+    def put_many(self, records: Iterable[dict]) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    self._fingerprint,
+                    record["result_index"],
+                    self._source,
+                    _dump_record(record),
+                    self._context,
+                )
+                for record in records
+            ),
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def _dump_record(record: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(record).decode("utf-8")
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _file_fingerprint(
+    sarif_path: str | pathlib.Path, src_zip: str | pathlib.Path, context: int, format_version: int
+) -> str:
+    parts = [str(context), str(format_version)]
+    for path in (pathlib.Path(sarif_path), pathlib.Path(src_zip)):
+        stat = path.stat()
+        parts += [str(path.resolve()), str(stat.st_mtime_ns), str(stat.st_size)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
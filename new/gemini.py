@@ -3,60 +3,249 @@
 #
 
 import argparse
+import asyncio
+import hashlib
+import importlib.util
 import json
 import os
 import sys
+import time
+from typing import AsyncIterator, Callable, Literal, Optional, TypeVar, cast
 from dotenv import load_dotenv
+from pydantic import BaseModel
 
 load_dotenv()
 
 try:
+    import httpx
     from google import genai
-    from google.genai import types
+    from google.genai import errors, types
 except ImportError as exc:
     raise SystemExit(
         "The google-genai package is required. Install it with 'pip install google-genai'."
     ) from exc
 
+try:
+    import ijson
+except ImportError:
+    # Batched verdicts are then parsed once the whole response has arrived.
+    ijson = None
+
 # Ensure we can import local helpers.
 sys.path.append(os.path.dirname(__file__))
 
-from result_inspector import extract_context_records, format_finding_as_prompt
+from cache import LLMCache
+from result_inspector import (
+    RECORD_CACHE_PATH,
+    batch_findings_block,
+    dynamic_finding_block,
+    extract_context_records,
+    format_finding_as_prompt,
+    static_system_prompt,
+)
 
 MODEL_NAME = os.environ.get("GEMINI_MODEL", "gemini-2.5-pro")
 
+MAX_CONCURRENCY = 10
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 1
+CACHE_PATH = os.path.join(os.path.dirname(__file__), ".cache", "responses.sqlite3")
+PROMPT_CACHE_TTL = "3600s"
+# Smallest prompt Gemini accepts as explicit cached content, per model.
+MIN_CACHE_TOKENS = {"gemini-2.5-flash": 1024, "gemini-2.5-pro": 4096}
+REQUEST_TIMEOUT_MS = 120_000
+
+
+
+def build_client(api_key: str, max_concurrency: int = MAX_CONCURRENCY) -> tuple[genai.Client, httpx.AsyncClient]:
+    """Creates the client shared by every request in the process.
+
+    Both transports keep up to ``max_concurrency`` connections alive, so
+    concurrent and follow-up requests reuse TLS sessions instead of
+    handshaking again. HTTP/2 is enabled when the h2 package is installed.
+    Also returns the httpx client behind ``client.aio``, which the caller
+    must close.
+    """
+    http2 = importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    # An explicit httpx client also keeps the SDK from switching to aiohttp.
+    async_client = httpx.AsyncClient(http2=http2, limits=limits, timeout=REQUEST_TIMEOUT_MS / 1000)
+    client = genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            timeout=REQUEST_TIMEOUT_MS,
+            client_args={"http2": http2, "limits": limits},
+            httpx_async_client=async_client,
+        ),
+    )
+    return client, async_client
 
 
 def _as_content(text: str, role: str = "user") -> types.Content:
     return types.Content(role=role, parts=[types.Part.from_text(text=text)])
 
 
+class PromptCache:
+    """The static triage instructions as Gemini cached content, created on first use.
+
+    Nothing is uploaded until a request actually needs the instructions, so
+    runs answered entirely from the response cache make no extra calls. The
+    cache is skipped when the instructions are below the model's minimum
+    cacheable size; ``name`` is then None and callers send the instructions
+    inline as the first message instead, where Gemini's implicit prefix
+    caching can still reuse them.
+    """
+
+    def __init__(self, client: genai.Client):
+        self._client = client
+        self._name: Optional[str] = None
+        self._attempted = False
+
+    @property
+    def name(self) -> Optional[str]:
+        if not self._attempted:
+            self._attempted = True
+            self._name = self._create()
+        return self._name
+
+    def _create(self) -> Optional[str]:
+        minimum = MIN_CACHE_TOKENS.get(MODEL_NAME, 4096)
+        # Check the local estimate first; only a prefix that could qualify is worth a count_tokens call.
+        if _estimate_tokens(static_system_prompt()) < minimum:
+            return None
+        contents = [_as_content(static_system_prompt(), role="user")]
+        try:
+            counted = self._client.models.count_tokens(model=MODEL_NAME, contents=contents)
+            if (counted.total_tokens or 0) < minimum:
+                return None
+            cached = self._client.caches.create(
+                model=MODEL_NAME,
+                config=types.CreateCachedContentConfig(contents=contents, ttl=PROMPT_CACHE_TTL),
+            )
+        except (errors.APIError, httpx.HTTPError) as exc:
+            print(f"Prompt caching unavailable, sending instructions inline: {exc}")
+            return None
+        return cached.name
+
+    def close(self) -> None:
+        if self._name:
+            try:
+                self._client.caches.delete(name=self._name)
+            except (errors.APIError, httpx.HTTPError):
+                # The cache expires on its own after PROMPT_CACHE_TTL.
+                pass
+            self._name = None
+
+
+def _cached_content(prompt_cache: Optional[PromptCache]) -> Optional[str]:
+    return prompt_cache.name if prompt_cache is not None else None
+
+
+def _initial_history(cached_content: Optional[str]) -> list[types.Content]:
+    # The static instructions always come first, either from the server-side cache or inline.
+    if cached_content:
+        return []
+    return [_as_content(static_system_prompt(), role="user")]
+
+
+class Verdict(BaseModel):
+    """Structured verdict for one finding of a batched request."""
+
+    index: int
+    analysis_summary: str
+    verdict: Literal["malicious", "benign", "unsure"]
+    confidence: Literal["high", "medium", "low"]
+    reason: str
+
+
+def _generation_config(cached_content: Optional[str], **options) -> Optional[types.GenerateContentConfig]:
+    if cached_content:
+        options["cached_content"] = cached_content
+    if options:
+        return types.GenerateContentConfig(**options)
+    return None
+
+
+# Cached responses are tied to the instructions that produced them.
+_INSTRUCTIONS_DIGEST = hashlib.sha256(static_system_prompt().encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_scope(record: dict, mode: Literal["single", "batch"]) -> str:
+    """Responses are only shared between findings of the same rule and sink file.
+
+    ``mode`` separates free-text analyses from the JSON verdicts of batched
+    requests, which answer the same finding in a different format.
+    """
+    return "\0".join(
+        [mode, _INSTRUCTIONS_DIGEST, str(record.get("rule_id")), str(record.get("sink", {}).get("uri"))]
+    )
+
+
 def _send_and_record_response(
-    client: genai.Client, history: list[types.Content], prompt: str
+    client: genai.Client,
+    history: list[types.Content],
+    prompt: str,
+    cache: Optional[LLMCache] = None,
+    cache_key: Optional[str] = None,
+    prompt_cache: Optional[PromptCache] = None,
+    cache_scope: str = "",
 ) -> str:
+    """Sends ``prompt``, streaming the reply to stdout as it arrives, and records both turns.
+
+    ``history`` holds the conversation without the static instructions, which
+    are prepended to every request.
+    """
+    # Only turns given a cache_key are cacheable; follow-ups depend on the whole conversation.
+    cacheable = cache is not None and cache_key is not None
     history.append(_as_content(prompt, role="user"))
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=history,
-    )
-    text = response.text or ""
+    text = cache.get(MODEL_NAME, cache_key, cache_scope) if cacheable else None
+    if text is not None:
+        print(text, end="")
+    else:
+        chunks: list[str] = []
+        cached_content = _cached_content(prompt_cache)
+        for chunk in client.models.generate_content_stream(
+            model=MODEL_NAME,
+            contents=_initial_history(cached_content) + history,
+            config=_generation_config(cached_content),
+        ):
+            if chunk.text:
+                print(chunk.text, end="", flush=True)
+                chunks.append(chunk.text)
+        text = "".join(chunks)
+        if cacheable:
+            cache.put(MODEL_NAME, cache_key, text, cache_scope)
+    print()
     history.append(_as_content(text, role="model"))
     return text
 
 
-def start_chat_session(client: genai.Client, finding_record: dict):
+def start_chat_session(
+    client: genai.Client,
+    finding_record: dict,
+    cache: Optional[LLMCache] = None,
+    prompt_cache: Optional[PromptCache] = None,
+):
     """Starts an interactive chat session for a single security finding."""
     conversation_history: list[types.Content] = []
     initial_prompt = format_finding_as_prompt(finding_record)
+    finding_block = dynamic_finding_block(finding_record)
 
     print("--- Sending Initial Prompt to Gemini ---")
     print(initial_prompt)
     print("----------------------------------------")
 
     try:
-        reply_text = _send_and_record_response(client, conversation_history, initial_prompt)
         print("\n--- Gemini's Analysis ---")
-        print(reply_text)
+        _send_and_record_response(
+            client,
+            conversation_history,
+            finding_block,
+            cache,
+            cache_key=finding_block,
+            prompt_cache=prompt_cache,
+            cache_scope=_cache_scope(finding_record, "single"),
+        )
         print("-------------------------\n")
     except Exception as exc:
         print(f"An error occurred while communicating with the Gemini API: {exc}")
@@ -74,8 +263,9 @@ def start_chat_session(client: genai.Client, finding_record: dict):
                 break
 
             print("...sending to Gemini...")
-            reply_text = _send_and_record_response(client, conversation_history, user_input)
-            print(f"\nGemini: {reply_text}\n")
+            print("\nGemini: ", end="")
+            _send_and_record_response(client, conversation_history, user_input, prompt_cache=prompt_cache)
+            print()
         except KeyboardInterrupt:
             raise SystemExit("\nExiting.")
         except Exception as exc:
@@ -83,6 +273,280 @@ def start_chat_session(client: genai.Client, finding_record: dict):
             break
 
 
+class RateLimiter:
+    """Token-bucket throttle for requests/min and tokens/min.
+
+    Capacity refills continuously; a 429 response drains both buckets and
+    pauses every caller for ``cooldown`` seconds so the quota can recover.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, cooldown: float = 15.0):
+        self.max_requests = requests_per_minute
+        self.max_tokens = tokens_per_minute
+        self.cooldown = cooldown
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.max_requests, self._requests + elapsed * self.max_requests / 60.0)
+        self._tokens = min(self.max_tokens, self._tokens + elapsed * self.max_tokens / 60.0)
+
+    async def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.max_tokens)
+        while True:
+            async with self._lock:
+                self._refill()
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                if wait <= 0:
+                    missing_requests = max(1 - self._requests, 0) * 60.0 / self.max_requests
+                    missing_tokens = max(tokens - self._tokens, 0) * 60.0 / self.max_tokens
+                    wait = max(missing_requests, missing_tokens)
+            await asyncio.sleep(wait)
+
+    def record_rate_limited(self) -> None:
+        self._requests = 0
+        self._tokens = 0
+        self._paused_until = time.monotonic() + self.cooldown
+
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English prose and source code.
+    return len(text) // 4 + 1
+
+
+async def _generate(
+    client: genai.Client,
+    contents: list[types.Content],
+    config: Optional[types.GenerateContentConfig],
+    limiter: RateLimiter,
+    tokens: int,
+) -> types.GenerateContentResponse:
+    attempt = 0
+    while True:
+        attempt += 1
+        await limiter.acquire(tokens)
+        try:
+            return await client.aio.models.generate_content(model=MODEL_NAME, contents=contents, config=config)
+        except errors.APIError as exc:
+            if exc.code != 429 or attempt == MAX_ATTEMPTS:
+                raise
+            limiter.record_rate_limited()
+
+
+async def _stream_text(
+    client: genai.Client,
+    contents: list[types.Content],
+    config: Optional[types.GenerateContentConfig],
+    limiter: RateLimiter,
+    tokens: int,
+) -> AsyncIterator[str]:
+    attempt = 0
+    while True:
+        attempt += 1
+        await limiter.acquire(tokens)
+        received = False
+        try:
+            stream = await client.aio.models.generate_content_stream(
+                model=MODEL_NAME, contents=contents, config=config
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    received = True
+                    yield chunk.text
+            return
+        except errors.APIError as exc:
+            # A rate limit surfaces before the first chunk; never replay a partially consumed stream.
+            if received or exc.code != 429 or attempt == MAX_ATTEMPTS:
+                raise
+            limiter.record_rate_limited()
+
+
+async def _consume_json_array(chunks: AsyncIterator[str], accept: Callable[[object], None]) -> None:
+    """Feeds each element of a streamed JSON array to ``accept`` as soon as it is complete."""
+    if ijson is None:
+        for item in json.loads("".join([chunk async for chunk in chunks])):
+            accept(item)
+        return
+    items = ijson.sendable_list()
+    parser = ijson.items_coro(items, "item")
+    async for chunk in chunks:
+        parser.send(chunk.encode("utf-8"))
+        for item in items:
+            accept(item)
+        del items[:]
+    parser.close()
+    for item in items:
+        accept(item)
+
+
+_JSON_ERRORS = (ValueError, TypeError) + ((ijson.JSONError,) if ijson is not None else ())
+
+
+async def _triage_one(
+    client: genai.Client,
+    record: dict,
+    semaphore: asyncio.Semaphore,
+    limiter: RateLimiter,
+    cache: Optional[LLMCache] = None,
+    prompt_cache: Optional[PromptCache] = None,
+) -> str:
+    # Cache on the finding alone: the shared instructions would swamp its embedding.
+    block = dynamic_finding_block(record)
+    scope = _cache_scope(record, "single")
+    if cache is not None:
+        cached = cache.get(MODEL_NAME, block, scope)
+        if cached is not None:
+            return cached
+    cached_content = _cached_content(prompt_cache)
+    async with semaphore:
+        response = await _generate(
+            client,
+            _initial_history(cached_content) + [_as_content(block, role="user")],
+            _generation_config(cached_content),
+            limiter,
+            _estimate_tokens(format_finding_as_prompt(record)),
+        )
+    text = response.text or ""
+    if cache is not None:
+        cache.put(MODEL_NAME, block, text, scope)
+    return text
+
+
+async def triage_batch(
+    client: genai.Client,
+    records: list[dict],
+    semaphore: asyncio.Semaphore,
+    limiter: RateLimiter,
+    cache: Optional[LLMCache] = None,
+    prompt_cache: Optional[PromptCache] = None,
+) -> list[str | BaseException]:
+    """Triages several findings with one request returning a JSON array of verdicts.
+
+    The response is streamed and each verdict is cached as soon as its array
+    element is complete. Findings already in the cache are skipped; any the
+    response does not cover are retried with their own request. A failed
+    retry is returned in place of that finding's reply only.
+    """
+    prompts = [dynamic_finding_block(record) for record in records]
+    scopes = [_cache_scope(record, "batch") for record in records]
+    replies: list[str | BaseException | None] = [
+        cache.get(MODEL_NAME, prompt, scope) if cache is not None else None
+        for prompt, scope in zip(prompts, scopes)
+    ]
+    pending = [index for index, reply in enumerate(replies) if reply is None]
+    if not pending:
+        return cast(list[str | BaseException], replies)
+
+    def accept(item: object) -> None:
+        try:
+            verdict = Verdict.model_validate(item)
+        except ValueError:
+            return
+        if not 0 <= verdict.index < len(pending):
+            return
+        index = pending[verdict.index]
+        if replies[index] is None:
+            reply = verdict.model_dump_json(exclude={"index"}, indent=2)
+            replies[index] = reply
+            if cache is not None:
+                cache.put(MODEL_NAME, prompts[index], reply, scopes[index])
+
+    block = batch_findings_block([records[index] for index in pending])
+    cached_content = _cached_content(prompt_cache)
+    async with semaphore:
+        chunks = _stream_text(
+            client,
+            _initial_history(cached_content) + [_as_content(block, role="user")],
+            _generation_config(
+                cached_content,
+                response_mime_type="application/json",
+                response_schema=list[Verdict],
+            ),
+            limiter,
+            _estimate_tokens(static_system_prompt() + block),
+        )
+        try:
+            await _consume_json_array(chunks, accept)
+        except _JSON_ERRORS:
+            # Keep the verdicts parsed so far; the rest are retried individually.
+            pass
+        finally:
+            await chunks.aclose()
+
+    missing = [index for index in pending if replies[index] is None]
+    retried = await asyncio.gather(
+        *(_triage_one(client, records[index], semaphore, limiter, cache, prompt_cache) for index in missing),
+        return_exceptions=True,
+    )
+    for index, outcome in zip(missing, retried):
+        replies[index] = outcome
+    # Every finding now has a reply or the exception its retry raised.
+    return cast(list[str | BaseException], replies)
+
+
+async def triage_all(
+    client: genai.Client,
+    records: list[dict],
+    concurrency: int = MAX_CONCURRENCY,
+    requests_per_minute: float = 60,
+    tokens_per_minute: float = 1_000_000,
+    cache: Optional[LLMCache] = None,
+    prompt_cache: Optional[PromptCache] = None,
+    batch_size: int = BATCH_SIZE,
+) -> list[str | BaseException]:
+    """Sends the initial prompt for every finding concurrently.
+
+    With ``batch_size`` above one, findings are grouped into requests of that
+    many via triage_batch. Returns one entry per record, in order: the model's
+    reply, or the exception raised while requesting it.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    if batch_size <= 1:
+        return await asyncio.gather(
+            *(_triage_one(client, record, semaphore, limiter, cache, prompt_cache) for record in records),
+            return_exceptions=True,
+        )
+
+    batches = [records[start : start + batch_size] for start in range(0, len(records), batch_size)]
+    outcomes = await asyncio.gather(
+        *(triage_batch(client, batch, semaphore, limiter, cache, prompt_cache) for batch in batches),
+        return_exceptions=True,
+    )
+    replies: list[str | BaseException] = []
+    for batch, outcome in zip(batches, outcomes):
+        replies.extend([outcome] * len(batch) if isinstance(outcome, BaseException) else outcome)
+    return replies
+
+
+_Number = TypeVar("_Number", int, float)
+
+
+def _positive(convert: Callable[[str], _Number]) -> Callable[[str], _Number]:
+    """Argparse type accepting only values above zero."""
+
+    def parse(text: str) -> _Number:
+        try:
+            value = convert(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid number: {text!r}")
+        if value <= 0:
+            raise argparse.ArgumentTypeError(f"must be greater than zero: {text!r}")
+        return value
+
+    return parse
+
+
 def main():
     parser = argparse.ArgumentParser(description="Triage security findings using Gemini (google-genai).")
     parser.add_argument("--sarif", required=True, help="Path to SARIF results file.")
@@ -93,16 +557,50 @@ def main():
         "--api-key",
         help="Gemini API key. If not provided, the GEMINI_API_KEY environment variable is used.",
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Analyze all findings concurrently without the interactive chat (implied when stdin is not a TTY).",
+    )
+    parser.add_argument(
+        "--concurrency", type=_positive(int), default=MAX_CONCURRENCY, help="Maximum in-flight requests in batch mode."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=_positive(int),
+        default=BATCH_SIZE,
+        help="Findings per request in batch mode; above 1, verdicts come back as a JSON array.",
+    )
+    parser.add_argument("--rpm", type=_positive(float), default=60, help="Requests-per-minute limit in batch mode.")
+    parser.add_argument("--tpm", type=_positive(float), default=1_000_000, help="Input tokens-per-minute limit in batch mode.")
+    parser.add_argument("--cache", default=CACHE_PATH, help="Path to the response cache database.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always query Gemini and rebuild records, bypassing both caches.",
+    )
+    parser.add_argument(
+        "--cache-threshold",
+        type=float,
+        default=0.92,
+        help="Minimum cosine similarity for a semantic cache hit.",
+    )
     args = parser.parse_args()
 
     api_key = args.api_key or os.environ.get("GEMINI_API_KEY")
     if not api_key:
         raise SystemExit("Error: Gemini API key not provided. Use --api-key or set GEMINI_API_KEY.")
 
-    client = genai.Client(api_key=api_key)
-
     try:
-        records = extract_context_records(args.sarif, args.src_zip, args.context, args.limit)
+        records = list(
+            extract_context_records(
+                args.sarif,
+                args.src_zip,
+                args.context,
+                args.limit,
+                cache_path=None if args.no_cache else RECORD_CACHE_PATH,
+            )
+        )
     except SystemExit as exc:
         print(f"Error: {exc}")
         sys.exit(1)
@@ -112,9 +610,38 @@ def main():
         return
 
     print(f"Found {len(records)} findings to analyze.")
-    for idx, record in enumerate(records):
-        print(f"\n--- Analyzing Finding {idx + 1}/{len(records)} ---")
-        start_chat_session(client, record)
+    client, async_client = build_client(api_key, args.concurrency)
+    cache = None if args.no_cache else LLMCache(args.cache, threshold=args.cache_threshold)
+    prompt_cache = PromptCache(client)
+    try:
+        if args.batch or not sys.stdin.isatty():
+            replies = asyncio.run(
+                triage_all(
+                    client,
+                    records,
+                    args.concurrency,
+                    args.rpm,
+                    args.tpm,
+                    cache,
+                    prompt_cache,
+                    args.batch_size,
+                )
+            )
+            for idx, reply in enumerate(replies):
+                print(f"\n--- Gemini's Analysis of Finding {idx + 1}/{len(records)} ---")
+                if isinstance(reply, BaseException):
+                    print(f"An error occurred while communicating with the Gemini API: {reply}")
+                else:
+                    print(reply)
+        else:
+            for idx, record in enumerate(records):
+                print(f"\n--- Analyzing Finding {idx + 1}/{len(records)} ---")
+                start_chat_session(client, record, cache, prompt_cache)
+    finally:
+        prompt_cache.close()
+        asyncio.run(async_client.aclose())
+        if cache is not None:
+            cache.close()
 
     print("\n--- All findings analyzed. ---")
 
@@ -1,64 +1,60 @@
 import argparse
+import itertools
 import json
+import mmap
+import multiprocessing
+import os
 import pathlib
 import pprint
+import struct
 import textwrap
+import threading
 import zipfile
-from collections import Counter
-from functools import lru_cache
-from typing import Iterable, Optional
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from multiprocessing.pool import AsyncResult
+from types import MappingProxyType
+from typing import IO, Any, Iterable, Iterator, Mapping, Optional, cast
+
+from cache import RecordCache
+
+try:
+    import ijson  # type: ignore[import-untyped]
+except ImportError:
+    # Fall back to loading whole SARIF files with the json module.
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    from mypy_extensions import mypyc_attr
+except ImportError:
+    # Only needed when compiling this module with mypyc; a no-op otherwise.
+    def mypyc_attr(*attrs: str, **kwattrs: object):  # type: ignore[misc]
+        return lambda cls: cls
+
+
+# Built once at import: the instructions are identical for every finding.
+_STATIC_PROMPT: str = textwrap.dedent("""\
+    You are a Senior Product Security Engineer. Your goal is to triage static analysis results from CodeQL to identify False Positives.
+    You prioritize precision but must not dismiss alerts without clear evidence of sanitization or lack of reachability.
+
+    # TASK
+    Analyze the CodeQL alert that follows these instructions for a potential shell-command injection vulnerability.
+
+    **Benign Example (for reference):**
+    This is an example of a benign finding. The user input is sanitized before being used in the command.
+    ```javascript
+    const userInput = req.query.filename;
+    // Benign: The input is sanitized using a known library before being used.
+    const sanitizedInput = DOMPurify.sanitize(userInput);
+    const result = execSync(`ls -l sanitizedinput`);
+    ```
 
-
-def format_finding_as_prompt(record: dict) -> str:
-    """Formats a single finding record into a detailed LLM prompt."""
-
-    prompt = f"""You are a Senior Product Security Engineer. Your goal is to triage static analysis results from CodeQL to identify False Positives.
-You prioritize precision but must not dismiss alerts without clear evidence of sanitization or lack of reachability.
-
-# TASK
-Analyze the following CodeQL alert for a potential shell-command injection vulnerability.
-
-**Benign Example (for reference):**
-This is an example of a benign finding. The user input is sanitized before being used in the command.
-```javascript
-const userInput = req.query.filename;
-// Benign: The input is sanitized using a known library before being used.
-const sanitizedInput = DOMPurify.sanitize(userInput);
-const result = execSync(`ls -l sanitizedinput`);
-```
-
-**Alert to Triage:**
-Rule: {record.get('rule_id', 'N/A')}
-Score: {record.get('score', 'N/A')}
-File: {record.get('sink', {}).get('uri', 'N/A')}
-Line: {record.get('sink', {}).get('start_line', 'N/A')}
-
-Sink (where the command is executed):
-```
-{record.get('sink', {}).get('snippet', 'No snippet available.')}
-```
-
-Source (where the input originates):
-```
-{record.get('source', {}).get('snippet', 'No snippet available.')}
-```
-
-Taint Path (data flow from source to sink):
-"""
-
-    path_steps = record.get('path', [])
-    if not path_steps:
-        prompt += "No data flow path available.\n"
-    else:
-        for i, step in enumerate(path_steps):
-            message = step.get('message', 'Step')
-            location = step.get('location', {})
-            uri = location.get('uri', 'N/A')
-            line = location.get('start_line', 'N/A')
-            prompt += f"{i+1}. {message} at {uri}:{line}\n"
-
-    prompt += textwrap.dedent("""
-    
     ANALYSIS INSTRUCTIONS
 
     Think step-by-step. Do not provide the JSON verdict yet. Analyze the code in the following order:
@@ -70,8 +66,8 @@ Taint Path (data flow from source to sink):
     Mitigation Analysis: Is there any code between the source and sink that validates or sanitizes the input? (e.g., shlex.quote, regex whitelisting, type casting).
 
     Data Flow Reality: Does the data actually flow from the variable defined in the source to the sink, or is the path broken?
-    
-    
+
+
     Please answer these questions:
     1. Does the command execute user-controlled or environment-derived input?
     2. Is there any sanitization or validation of the input?
@@ -88,21 +84,128 @@ Taint Path (data flow from source to sink):
 
     Unsure: The context is missing critical definitions (e.g., imported functions) required to make a decision.
 
-    Return ONLY a JSON object with this structure: {{ "analysis_summary": "One sentence summary of your step-by-step thinking.", "verdict": "malicious|benign|unsure", "confidence": "high|medium|low", "reason": "A concise technical explanation referencing specific variable names and lines from the snippets." }}
+    Return ONLY a JSON object with this structure: { "analysis_summary": "One sentence summary of your step-by-step thinking.", "verdict": "malicious|benign|unsure", "confidence": "high|medium|low", "reason": "A concise technical explanation referencing specific variable names and lines from the snippets." }
     """)
 
-    return prompt
+_FINDING_TEMPLATE = """**Alert to Triage:**
+Rule: %(rule_id)s
+Score: %(score)s
+File: %(uri)s
+Line: %(line)s
+
+Sink (where the command is executed):
+```
+%(sink_snippet)s
+```
+
+Source (where the input originates):
+```
+%(source_snippet)s
+```
+
+Taint Path (data flow from source to sink):
+"""
+
+
+def static_system_prompt() -> str:
+    """Returns the triage instructions shared by every finding prompt.
+
+    This text is identical for every finding so that it can be sent as a
+    cacheable prefix ahead of the finding-specific block.
+    """
+
+    return _STATIC_PROMPT
+
+
+def dynamic_finding_block(record: dict) -> str:
+    """Formats the finding-specific part of the prompt: alert metadata, snippets and taint path."""
+
+    sink = record.get('sink', {})
+    source = record.get('source', {})
+    header = _FINDING_TEMPLATE % {
+        'rule_id': record.get('rule_id', 'N/A'),
+        'score': record.get('score', 'N/A'),
+        'uri': sink.get('uri', 'N/A'),
+        'line': sink.get('start_line', 'N/A'),
+        'sink_snippet': sink.get('snippet', 'No snippet available.'),
+        'source_snippet': source.get('snippet', 'No snippet available.'),
+    }
+
+    path_steps = record.get('path', [])
+    if not path_steps:
+        return header + "No data flow path available.\n"
+    steps = []
+    for i, step in enumerate(path_steps, 1):
+        location = step.get('location', {})
+        steps.append(f"{i}. {step.get('message', 'Step')} at {location.get('uri', 'N/A')}:{location.get('start_line', 'N/A')}")
+    return "".join([header, "\n".join(steps), "\n"])
+
+
+def batch_findings_block(records: list[dict]) -> str:
+    """Formats several findings as one numbered block to be triaged in a single request."""
+
+    blocks = [f"## Alert {index}\n\n{dynamic_finding_block(record)}" for index, record in enumerate(records)]
+    blocks.append(
+        f"Triage each of the {len(records)} alerts above independently. Instead of a single JSON object, "
+        "return ONLY a JSON array with one object per alert, using the same structure plus an "
+        '"index" field holding the alert number.\n'
+    )
+    return "\n".join(blocks)
+
+
+def format_finding_as_prompt(record: dict) -> str:
+    """Formats a single finding record into a detailed LLM prompt."""
+
+    return static_system_prompt() + "\n" + dynamic_finding_block(record)
 
 
 
 def load_json(path: str | pathlib.Path) -> dict:
     path = pathlib.Path(path)
     try:
+        if orjson is not None:
+            return orjson.loads(path.read_bytes())
         return json.loads(path.read_text())
     except FileNotFoundError:
         raise SystemExit(f"File not found: {path}")
 
 
+def iter_sarif_results(path: str | pathlib.Path) -> Iterator[dict]:
+    """Yields the results of the first run in a SARIF file one at a time.
+
+    With ijson installed the file is parsed incrementally, so memory use is
+    bounded by a single result rather than the whole document.
+    """
+    path = pathlib.Path(path)
+    if ijson is None:
+        runs = load_json(path).get("runs", [])
+        if not runs:
+            raise SystemExit("SARIF file has no runs.")
+        yield from runs[0].get("results", [])
+        return
+
+    seen_run = False
+
+    def first_run(events):
+        nonlocal seen_run
+        for prefix, event, value in events:
+            yield prefix, event, value
+            if prefix == "runs.item":
+                if event == "start_map":
+                    seen_run = True
+                elif event == "end_map":
+                    return
+
+    try:
+        handle = path.open("rb")
+    except FileNotFoundError:
+        raise SystemExit(f"File not found: {path}")
+    with handle:
+        yield from ijson.items(first_run(ijson.parse(handle, use_float=True)), "runs.item.results.item")
+    if not seen_run:
+        raise SystemExit("SARIF file has no runs.")
+
+
 def sarif_summary(path: str, limit: int) -> None:
     data = load_json(path)
     runs = data.get("runs", [])
@@ -111,8 +214,8 @@ def sarif_summary(path: str, limit: int) -> None:
         return
     run = runs[0]
     results = run.get("results", [])
-    print(f"Runs: {len(runs)} | Results: {len
-    (results)}")
+    print(f"Runs: {len(runs)} | Results: {len(results)}")
+    # Counter tallies in C (_count_elements); numpy.unique sorts object arrays and is slower here.
     counts = Counter(res.get("ruleId", "<unknown>") for res in results)
     print("Rule counts:")
     for rule_id, count in counts.most_common():
@@ -128,15 +231,13 @@ def sarif_summary(path: str, limit: int) -> None:
 
 
 def sarif_result(path: str, index: int) -> None:
-    data = load_json(path)
-    runs = data.get("runs", [])
-    if not runs:
-        raise SystemExit("No runs in SARIF file.")
-    results = runs[0].get("results", [])
-    if not (0 <= index < len(results)):
-        raise SystemExit(f"Result index {index} out of range (0..{len(results)-1}).")
-    res = results[index]
-    pprint.pprint(res)
+    count = 0
+    for res in iter_sarif_results(path):
+        if count == index:
+            pprint.pprint(res)
+            return
+        count += 1
+    raise SystemExit(f"Result index {index} out of range (0..{count-1}).")
 
 
 def _format_sarif_location(res: dict) -> str:
@@ -185,6 +286,32 @@ def _col_name(col: dict) -> str:
     return f"{base}:{kind}" if kind else base
 
 
+PREFETCH_CHUNK = 256
+RECORD_CACHE_PATH = pathlib.Path(__file__).parent / ".cache" / "records.sqlite3"
+# Part of the record cache key: bump whenever _build_record or the snippet format changes.
+RECORD_FORMAT_VERSION = 1
+# Shared default for nested SARIF lookups: `.get(key, {})` allocates a fresh dict on every call.
+_EMPTY: Mapping = MappingProxyType({})
+_LOCAL_HEADER_SIZE = 30
+JSONL_BUFFER_SIZE = 1 << 20
+# Entries kept by each SourceArchive memo (resolved uris, snippets, region payloads).
+MEMO_SIZE = 4096
+# Decoded source files kept by each SourceArchive.
+LINES_MEMO_SIZE = 256
+
+
+# mypyc cannot compile a native subclass of a C extension type like mmap.
+@mypyc_attr(native_class=False)
+class _MappedFile(mmap.mmap):
+    """Read-only mmap usable as the file object of a ZipFile.
+
+    zipfile requires seekable(), which mmap objects lack before Python 3.13.
+    """
+
+    def seekable(self) -> bool:
+        return True
+
+
 class SourceArchive:
     """Helper for retrieving snippets from the database source archive."""
 
@@ -192,71 +319,385 @@ class SourceArchive:
         self.zip_path = pathlib.Path(zip_path)
         if not self.zip_path.exists():
             raise SystemExit(f"Source archive not found: {self.zip_path}")
-        self._zip = zipfile.ZipFile(self.zip_path)
-        self._cache: dict[str, Optional[str]] = {}
+        # Map the archive so member reads come straight from the page cache
+        # instead of issuing a read() syscall per chunk.
+        self._file = self.zip_path.open("rb")
+        self._mm = _MappedFile(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._zip = zipfile.ZipFile(cast(IO[bytes], self._mm))
+        self._prefetched: dict[str, list[str]] = {}
+        self._windows: dict[str, list[tuple[int, int, list[str]]]] = {}
+        # The central directory is read once; nothing below calls namelist() again.
+        self._names = tuple(self._zip.namelist())
+        self._suffix_index = _SuffixNode()
+        for order, name in enumerate(self._names):
+            self._suffix_index.insert(name, order)
+        # Memos are per archive so that close() releases them along with it, and
+        # bounded (oldest entries evicted first) so memory stays flat over long SARIF files.
+        self._resolved: dict[str, Optional[str]] = {}
+        self._contexts: dict[tuple[Optional[str], Optional[int], int], Optional[dict]] = {}
+        self._regions: dict[
+            tuple[Optional[str], Optional[int], Optional[int], Optional[int], Optional[int], int], dict
+        ] = {}
+        self._lines: dict[str, list[str]] = {}
+        self._lines_lock = threading.Lock()
+
+    def close(self) -> None:
+        self._zip.close()
+        self._mm.close()
+        self._file.close()
+        self._resolved = {}
+        self._contexts = {}
+        self._regions = {}
+        self._lines = {}
+        self._prefetched = {}
+        self._windows = {}
+
+    def region_payload(
+        self,
+        uri: Optional[str],
+        start_line: Optional[int],
+        start_column: Optional[int],
+        end_line: Optional[int],
+        end_column: Optional[int],
+        context: int,
+    ) -> dict:
+        # Code flows revisit the same regions often; the returned dict is shared, so treat it as read-only.
+        key = (uri, start_line, start_column, end_line, end_column, context)
+        payload = self._regions.get(key)
+        if payload is None:
+            snippet = self.read_context(uri, start_line, context)
+            payload = {
+                "uri": uri,
+                "start_line": start_line,
+                "start_column": start_column,
+                "end_line": end_line,
+                "end_column": end_column,
+                "snippet": snippet["snippet"] if snippet else None,
+            }
+            _remember(self._regions, key, payload, MEMO_SIZE)
+        return payload
 
     def read_context(self, uri: Optional[str], line: Optional[int], context: int) -> Optional[dict]:
+        key = (uri, line, context)
+        if key in self._contexts:
+            return self._contexts[key]
+        result = self._read_context(uri, line, context)
+        _remember(self._contexts, key, result, MEMO_SIZE)
+        return result
+
+    def _read_context(self, uri: Optional[str], line: Optional[int], context: int) -> Optional[dict]:
         if not uri or not line:
             return None
         entry = self._resolve(uri)
         if entry is None:
             return None
-        lines = self._read_lines(entry)
+        lines = self._prefetched.get(entry)
+        if lines is None:
+            lines = self._read_lines(entry)
         index = max(line - 1, 0)
         start = max(index - context, 0)
         end = min(index + context, len(lines) - 1)
-        snippet_lines = []
-        for lineno in range(start, end + 1):
-            prefix = f"{lineno + 1:>5}: "
-            snippet_lines.append(prefix + lines[lineno].rstrip("\n"))
+        snippet = self._windowed_snippet(entry, start, end)
+        if snippet is None:
+            # splitlines() already stripped the line terminators.
+            snippet = "\n".join(f"{lineno:>5}: {text}" for lineno, text in enumerate(lines[start : end + 1], start + 1))
         return {
             "uri": uri,
             "zip_entry": entry,
             "line": line,
-            "snippet": "\n".join(snippet_lines),
+            "snippet": snippet,
         }
 
     def _resolve(self, uri: str) -> Optional[str]:
-        if uri in self._cache:
-            return self._cache[uri]
-        matches = [name for name in self._zip.namelist() if name.endswith(uri)]
-        entry = min(matches, key=len) if matches else None
-        self._cache[uri] = entry
+        """Returns the shortest zip entry name ending with ``uri``."""
+        if uri in self._resolved:
+            return self._resolved[uri]
+        entry = self._suffix_index.shortest_with_suffix(uri)
+        _remember(self._resolved, uri, entry, MEMO_SIZE)
         return entry
 
-    @lru_cache(maxsize=256)
+    def _windowed_snippet(self, entry: str, start: int, end: int) -> Optional[str]:
+        for window_start, window_end, formatted in self._windows.get(entry, ()):
+            if window_start <= start and end <= window_end:
+                return "\n".join(formatted[start - window_start : end - window_start + 1])
+        return None
+
+    def prefetch(
+        self,
+        locations: Iterable[tuple[str, Optional[int]]],
+        context: int,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        """Decompresses the entries behind ``locations`` (uri, line) in parallel.
+
+        zlib releases the GIL while inflating, so the reads overlap; without an
+        executor the entries are read one after another. The context
+        windows around the requested lines of each entry are merged and
+        formatted once, so read_context only slices them. Both replace those
+        from the previous prefetch.
+        """
+        wanted: dict[str, set[int]] = {}
+        for uri, line in locations:
+            entry = self._resolve(uri)
+            if entry is not None:
+                lines = wanted.setdefault(entry, set())
+                if line:
+                    lines.add(line)
+        if executor is None:
+            self._prefetched = {entry: self._read_lines(entry) for entry in wanted}
+        else:
+            futures = {entry: executor.submit(self._read_lines, entry) for entry in wanted}
+            self._prefetched = {entry: future.result() for entry, future in futures.items()}
+        self._windows = {
+            entry: _format_windows(self._prefetched[entry], sorted(lines), context)
+            for entry, lines in wanted.items()
+        }
+
     def _read_lines(self, entry: str) -> list[str]:
-        with self._zip.open(entry) as handle:
-            data = handle.read().decode("utf-8", errors="replace")
-        return data.splitlines()
+        lines = self._lines.get(entry)
+        if lines is None:
+            lines = self._read_member(entry).decode("utf-8", errors="replace").splitlines()
+            # prefetch() calls this from worker threads.
+            with self._lines_lock:
+                _remember(self._lines, entry, lines, LINES_MEMO_SIZE)
+        return lines
+
+    def _read_member(self, entry: str) -> bytes:
+        """Returns the uncompressed bytes of ``entry``, inflating straight from the mapping.
+
+        Going through ZipFile.open would copy the compressed data out of the map
+        in small reads serialized by the archive's file lock. Encrypted members
+        and compression methods other than stored/deflated still use zipfile.
+        """
+        info = self._zip.getinfo(entry)
+        if info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            with self._zip.open(entry) as handle:
+                return handle.read()
+        offset = info.header_offset
+        header = self._mm[offset : offset + _LOCAL_HEADER_SIZE]
+        if header[:4] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"Bad local file header for {entry!r}")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        start = offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+        with memoryview(self._mm) as view:
+            compressed = view[start : start + info.compress_size]
+            if info.compress_type == zipfile.ZIP_DEFLATED:
+                data = zlib.decompress(compressed, -zlib.MAX_WBITS)
+            else:
+                data = bytes(compressed)
+            compressed.release()
+        if zlib.crc32(data) != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {entry!r}")
+        return data
+
+
+def _format_windows(lines: list[str], line_numbers: list[int], context: int) -> list[tuple[int, int, list[str]]]:
+    """Merges the context windows around sorted ``line_numbers`` and formats each merged window once.
+
+    Returns ``(start, end, formatted_lines)`` tuples with 0-based inclusive bounds.
+    """
+    spans: list[tuple[int, int]] = []
+    for line in line_numbers:
+        index = max(line - 1, 0)
+        start = max(index - context, 0)
+        end = min(index + context, len(lines) - 1)
+        if start > end:
+            continue
+        if spans and start <= spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return [
+        (start, end, [f"{lineno:>5}: {text}" for lineno, text in enumerate(lines[start : end + 1], start + 1)])
+        for start, end in spans
+    ]
+
+
+def _remember(memo: dict, key: Any, value: Any, limit: int) -> None:
+    """Stores ``value`` in ``memo``, first evicting the oldest entry once ``limit`` is reached."""
+    if len(memo) >= limit:
+        del memo[next(iter(memo))]
+    memo[key] = value
+
+
+class _SuffixNode:
+    """Trie over reversed path segments of zip entry names.
+
+    Each node keeps the shortest entry (earliest in archive order on ties)
+    among all names whose trailing segments lead to it.
+    """
+
+    __slots__ = ("children", "best")
+
+    def __init__(self) -> None:
+        self.children: dict[str, "_SuffixNode"] = {}
+        self.best: Optional[tuple[int, int, str]] = None
+
+    def insert(self, name: str, order: int) -> None:
+        key = (len(name), order, name)
+        node = self
+        for segment in reversed(name.split("/")):
+            node = node.children.setdefault(segment, _SuffixNode())
+            if node.best is None or key < node.best:
+                node.best = key
+
+    def shortest_with_suffix(self, suffix: str) -> Optional[str]:
+        # Trailing segments must match exactly; the leading one may be a partial
+        # segment, matching any name segment that ends with it (str.endswith semantics).
+        head, *tail = suffix.split("/")
+        node = self
+        for segment in reversed(tail):
+            child = node.children.get(segment)
+            if child is None:
+                return None
+            node = child
+        candidates = [
+            child.best for key, child in node.children.items() if child.best is not None and key.endswith(head)
+        ]
+        return min(candidates)[2] if candidates else None
 
 
 def extract_context_records(
-    sarif_path: str, src_zip: str, context: int, limit: Optional[int] = None
-) -> list[dict]:
-    sarif = load_json(sarif_path)
-    runs = sarif.get("runs", [])
-    if not runs:
-        raise SystemExit("SARIF file has no runs.")
-    results = runs[0].get("results", [])
+    sarif_path: str,
+    src_zip: str,
+    context: int,
+    limit: Optional[int] = None,
+    workers: int = 1,
+    cache_path: Optional[str | pathlib.Path] = None,
+) -> Iterator[dict]:
+    """Yields one triage record per SARIF result, reading results lazily.
+
+    Results are handled in chunks of PREFETCH_CHUNK: the source files a chunk
+    refers to are decompressed on a thread pool, and the snippet windows it
+    needs are formatted, before its records are built. With ``workers`` above
+    one, chunks are instead spread over a process pool in which every worker
+    opens its own SourceArchive; records are still yielded in result order.
+
+    With ``cache_path``, records built by an earlier run over the same SARIF
+    file, source archive and context size are loaded from that RecordCache
+    instead of being rebuilt.
+    """
+    results: Iterator[tuple[int, dict[str, Any]]] = enumerate(iter_sarif_results(sarif_path))
+    if limit is not None:
+        results = itertools.islice(results, max(limit, 0))
+    chunks = iter(lambda: list(itertools.islice(results, PREFETCH_CHUNK)), [])
+    try:
+        cache = RecordCache(cache_path, sarif_path, src_zip, context, RECORD_FORMAT_VERSION) if cache_path else None
+    except FileNotFoundError:
+        # Let the uncached path report the missing input.
+        cache = None
+    if cache is None:
+        for records in _map_chunks(chunks, src_zip, context, workers):
+            yield from records
+        return
+
+    cached_chunks: deque[tuple[list[tuple[int, dict]], dict[int, dict]]] = deque()
+
+    def uncached(chunks: Iterator[list[tuple[int, dict]]]) -> Iterator[list[tuple[int, dict]]]:
+        for chunk in chunks:
+            hits = cache.get_many(idx for idx, _ in chunk)
+            cached_chunks.append((chunk, hits))
+            yield [(idx, result) for idx, result in chunk if idx not in hits]
+
+    try:
+        for built in _map_chunks(uncached(chunks), src_zip, context, workers):
+            chunk, hits = cached_chunks.popleft()
+            cache.put_many(built)
+            fresh = iter(built)
+            for idx, _ in chunk:
+                yield hits[idx] if idx in hits else next(fresh)
+    finally:
+        cache.close()
+
+
+def _map_chunks(
+    chunks: Iterator[list[tuple[int, dict]]], src_zip: str, context: int, workers: int
+) -> Iterator[list[dict]]:
+    """Builds the records of each chunk, yielding one list per chunk in order."""
+    if workers > 1:
+        yield from _extract_in_pool(chunks, src_zip, context, workers)
+        return
+
     archive = SourceArchive(src_zip)
-    records: list[dict] = []
-    for idx, result in enumerate(results):
-        if limit is not None and idx >= limit:
-            break
-        sink_loc = _first_physical_location(result.get("locations", []))
-        source_loc = _first_physical_location(result.get("relatedLocations", []))
-        record = {
-            "result_index": idx,
-            "rule_id": result.get("ruleId"),
-            "message": result.get("message", {}).get("text"),
-            "score": (result.get("properties") or {}).get("score"),
-            "sink": _location_payload(sink_loc, archive, context),
-            "source": _location_payload(source_loc, archive, context),
-            "path": _code_flow_steps(result.get("codeFlows", []), archive, context),
-        }
-        records.append(record)
-    return records
+    try:
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for chunk in chunks:
+                yield _chunk_records(chunk, archive, context, executor)
+    finally:
+        archive.close()
+
+
+def _chunk_records(
+    chunk: list[tuple[int, dict]], archive: SourceArchive, context: int, executor: Optional[Executor] = None
+) -> list[dict]:
+    locations = {location for _, result in chunk for location in _result_locations(result)}
+    archive.prefetch(locations, context, executor)
+    return [_build_record(idx, result, archive, context) for idx, result in chunk]
+
+
+def _extract_in_pool(
+    chunks: Iterator[list[tuple[int, dict]]], src_zip: str, context: int, workers: int
+) -> Iterator[list[dict]]:
+    # Workers cannot report a missing archive cleanly from their initializer.
+    if not pathlib.Path(src_zip).exists():
+        raise SystemExit(f"Source archive not found: {src_zip}")
+    with multiprocessing.Pool(workers, initializer=_worker_init, initargs=(str(src_zip), context)) as pool:
+        # Keep a bounded number of chunks in flight so the SARIF is still streamed.
+        pending: deque[AsyncResult[list[dict[str, Any]]]] = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_worker_process_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+# Per-process state for _extract_in_pool workers; zipfile handles cannot be shared across processes.
+_worker_archive: Optional[SourceArchive] = None
+_worker_context = 0
+
+
+def _worker_init(src_zip: str, context: int) -> None:
+    global _worker_archive, _worker_context
+    _worker_archive = SourceArchive(src_zip)
+    _worker_context = context
+
+
+def _worker_process_chunk(chunk: list[tuple[int, dict]]) -> list[dict]:
+    assert _worker_archive is not None, "_worker_init has not run in this process"
+    return _chunk_records(chunk, _worker_archive, _worker_context)
+
+
+def _build_record(idx: int, result: dict, archive: SourceArchive, context: int) -> dict:
+    get = result.get
+    record = {
+        "result_index": idx,
+        "rule_id": get("ruleId"),
+        "message": get("message", _EMPTY).get("text"),
+        "score": (get("properties") or _EMPTY).get("score"),
+        "sink": _location_payload(_first_physical_location(get("locations")), archive, context),
+        "source": _location_payload(_first_physical_location(get("relatedLocations")), archive, context),
+        "path": _code_flow_steps(get("codeFlows"), archive, context),
+    }
+    return record
+
+
+def _result_locations(result: dict) -> Iterator[tuple[str, Optional[int]]]:
+    """Yields the (uri, start line) of a result's sink, source and every code-flow step."""
+    locations = [
+        _first_physical_location(result.get("locations", [])),
+        _first_physical_location(result.get("relatedLocations", [])),
+    ]
+    for flow in result.get("codeFlows") or ():
+        for thread in flow.get("threadFlows", ()):
+            for node in thread.get("locations", ()):
+                locations.append(node.get("location", _EMPTY).get("physicalLocation"))
+    for location in locations:
+        if not location:
+            continue
+        uri = location.get("artifactLocation", _EMPTY).get("uri")
+        if uri:
+            yield uri, location.get("region", _EMPTY).get("startLine")
 
 
 def _first_physical_location(items: Iterable[dict] | None) -> Optional[dict]:
@@ -276,19 +717,15 @@ def _first_physical_location(items: Iterable[dict] | None) -> Optional[dict]:
 def _location_payload(location: Optional[dict], archive: SourceArchive, context: int) -> Optional[dict]:
     if not location:
         return None
-    artifact = location.get("artifactLocation", {})
-    region = location.get("region", {})
-    uri = artifact.get("uri")
-    snippet = archive.read_context(uri, region.get("startLine"), context)
-    payload = {
-        "uri": uri,
-        "start_line": region.get("startLine"),
-        "start_column": region.get("startColumn"),
-        "end_line": region.get("endLine"),
-        "end_column": region.get("endColumn"),
-        "snippet": snippet["snippet"] if snippet else None,
-    }
-    return payload
+    region = location.get("region", _EMPTY).get
+    return archive.region_payload(
+        location.get("artifactLocation", _EMPTY).get("uri"),
+        region("startLine"),
+        region("startColumn"),
+        region("endLine"),
+        region("endColumn"),
+        context,
+    )
 
 
 def _code_flow_steps(
@@ -297,14 +734,17 @@ def _code_flow_steps(
     steps: list[dict] = []
     if not code_flows:
         return steps
+    # Hot loop on large flows: bind the lookups once.
+    location_payload = _location_payload
+    append = steps.append
     for flow in code_flows:
-        for thread in flow.get("threadFlows", []):
-            for node in thread.get("locations", []):
-                loc = node.get("location", {})
-                message = (loc.get("message") or {}).get("text")
-                physical = loc.get("physicalLocation")
-                payload = _location_payload(physical, archive, context)
-                steps.append({"message": message, "location": payload})
+        for thread in flow.get("threadFlows", ()):
+            for node in thread.get("locations", ()):
+                loc = node.get("location", _EMPTY)
+                msg = loc.get("message")
+                message = msg.get("text") if msg else None
+                payload = location_payload(loc.get("physicalLocation"), archive, context)
+                append({"message": message, "location": payload})
     return steps
 
 
@@ -314,9 +754,11 @@ def generate_prompts(
     output_path: str,
     context: int,
     limit: Optional[int] = None,
+    workers: int = 1,
+    cache_path: Optional[str | pathlib.Path] = None,
 ) -> None:
     """Generate LLM prompts and write them to a file."""
-    records = extract_context_records(sarif_path, src_zip, context, limit)
+    records = extract_context_records(sarif_path, src_zip, context, limit, workers, cache_path)
     output = pathlib.Path(output_path)
     output.parent.mkdir(parents=True, exist_ok=True)
     prompts = [format_finding_as_prompt(rec) for rec in records]
@@ -326,6 +768,36 @@ def generate_prompts(
 
 
 
+def _jsonl_line(record: dict) -> bytes:
+    """Serializes a record as one compact UTF-8 JSONL line."""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _write_jsonl(records: Iterable[dict], output_path: pathlib.Path) -> int:
+    """Streams records to ``output_path`` as JSONL and returns how many were written.
+
+    Records are written to a temporary sibling that replaces the output only
+    once every record has been produced, so a failure (such as a missing
+    source archive, raised by the first record) leaves an existing output
+    untouched.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = output_path.with_name(output_path.name + ".partial")
+    count = 0
+    try:
+        with partial.open("wb", buffering=JSONL_BUFFER_SIZE) as handle:
+            for record in records:
+                handle.write(_jsonl_line(record))
+                count += 1
+        os.replace(partial, output_path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return count
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Inspect SARIF and decoded BQRS JSON files.")
     sub = parser.add_subparsers(dest="command", required=True)
@@ -355,6 +827,8 @@ def build_parser() -> argparse.ArgumentParser:
     extract.add_argument("--output", required=True, help="Destination JSONL file.")
     extract.add_argument("--context", type=int, default=5, help="Lines of context around each location.")
     extract.add_argument("--limit", type=int, help="Limit number of findings processed.")
+    extract.add_argument("--workers", type=int, default=1, help="Worker processes used to extract snippets.")
+    extract.add_argument("--no-cache", action="store_true", help="Rebuild every record, bypassing the record cache.")
 
     prompts = sub.add_parser(
         "generate-prompts",
@@ -365,6 +839,8 @@ def build_parser() -> argparse.ArgumentParser:
     prompts.add_argument("--output", required=True, help="Destination file for prompts.")
     prompts.add_argument("--context", type=int, default=5, help="Lines of context around each location.")
     prompts.add_argument("--limit", type=int, help="Limit number of findings processed.")
+    prompts.add_argument("--workers", type=int, default=1, help="Worker processes used to extract snippets.")
+    prompts.add_argument("--no-cache", action="store_true", help="Rebuild every record, bypassing the record cache.")
 
     return parser
 
@@ -381,16 +857,27 @@ def main() -> None:
     elif args.command == "bqrs-table":
         bqrs_table(args.path, args.table, args.limit)
     elif args.command == "extract-context":
-        records = extract_context_records(args.sarif, args.src_zip, args.context, args.limit)
+        records = extract_context_records(
+            args.sarif,
+            args.src_zip,
+            args.context,
+            args.limit,
+            args.workers,
+            None if args.no_cache else RECORD_CACHE_PATH,
+        )
         output_path = pathlib.Path(args.output)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        with output_path.open("w", encoding="utf-8") as handle:
-            for record in records:
-                json.dump(record, handle, ensure_ascii=False)
-                handle.write("\n")
-        print(f"Wrote {len(records)} records to {output_path}")
+        count = _write_jsonl(records, output_path)
+        print(f"Wrote {count} records to {output_path}")
     elif args.command == "generate-prompts":
-        generate_prompts(args.sarif, args.src_zip, args.output, args.context, args.limit)
+        generate_prompts(
+            args.sarif,
+            args.src_zip,
+            args.output,
+            args.context,
+            args.limit,
+            args.workers,
+            None if args.no_cache else RECORD_CACHE_PATH,
+        )
     else:
         parser.error(f"Unknown command {args.command}")
 
@@ -0,0 +1,74 @@
+import zipfile
+
+import pytest
+
+from result_inspector import SourceArchive
+
+NAMES = [
+    "src/index.js",
+    "lib/index.js",
+    "index.js",
+    "src/util/exec.js",
+    "vendor/src/util/exec.js",
+    "src/util/myexec.js",
+    "test/exec.js",
+    "a/b/c.ts",
+    "x/b/c.ts",
+    "ab/b/c.ts",
+    "deep/nested/path/to/file.json",
+    "other/to/file.json",
+]
+
+
+def _linear_resolve(names: list[str], uri: str):
+    return min((name for name in names if name.endswith(uri)), key=len, default=None)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "src.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for name in NAMES:
+            zf.writestr(name, f"// {name}\n")
+    archive = SourceArchive(path)
+    yield archive
+    archive.close()
+
+
+@pytest.mark.parametrize(
+    "uri",
+    [
+        # Bare basenames and full names.
+        "index.js",
+        "exec.js",
+        "c.ts",
+        "src/index.js",
+        "deep/nested/path/to/file.json",
+        # Leading slash: the first segment must match completely.
+        "/index.js",
+        "/exec.js",
+        "/util/exec.js",
+        "/b/c.ts",
+        # Partial leading segments.
+        "dex.js",
+        "xec.js",
+        "rc/util/exec.js",
+        "b/b/c.ts",
+        "o/file.json",
+        # Equal-length ties fall back to archive order.
+        "b/c.ts",
+        "/c.ts",
+        # No match.
+        "missing.js",
+        "z/index.js",
+        "/src/index.js/",
+    ],
+)
+def test_resolve_matches_endswith(archive, uri):
+    assert archive._resolve(uri) == _linear_resolve(NAMES, uri)
+
+
+def test_resolve_matches_endswith_for_every_suffix(archive):
+    suffixes = {name[start:] for name in NAMES for start in range(len(name))}
+    for uri in sorted(suffixes):
+        assert archive._resolve(uri) == _linear_resolve(NAMES, uri), uri